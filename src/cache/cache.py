@@ -8,21 +8,72 @@ Implements:
 - cache_set(key, response, intent, project, ttl)
 - cache_invalidate(project=None, intent=None)
 - cache_clear_expired()
+- cache_compact(max_age) → trim metric/invalidation history
 - cache_stats() → {hits, misses, entries, tokens_saved}
 """
 
 import sqlite3
 import json
-import hashlib
+import functools
+from collections import Counter
+from contextlib import contextmanager
+import threading
 import time
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
 import os
 
+from .key_generator import hash_cache_key
+
+try:
+    import orjson  # Optional: faster encode/decode of response payloads
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Buffered hit-count increments written back once this many hits pile up
+HIT_FLUSH_THRESHOLD = 100
+
+
+def _dumps(obj: Any) -> str:
+    """
+    Serialize a cached response, via orjson when installed.
+    
+    Known differences from stdlib json (accepted for speed, not pre-checked):
+    orjson writes NaN/±inf as null, and it accepts datetime, UUID, dataclass
+    and enum values that json.dumps rejects. Ints beyond 64 bits make orjson
+    raise, so those payloads fall back to json.dumps.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits; stdlib handles them
+    return json.dumps(obj)
+
+
+def _loads(data: str) -> Any:
+    """
+    Deserialize a cached response, via orjson when installed.
+    
+    Falls back to json.loads for what orjson rejects (NaN/Infinity written by
+    stdlib json). Known difference: orjson decodes ints beyond 64 bits as float.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass  # e.g. NaN written by stdlib json
+    return json.loads(data)
+
+
+@functools.lru_cache(maxsize=64)
+def _encode_entry_metadata(ttl: int, tier: str) -> str:
+    """Serialize entry metadata; (ttl, tier) pairs repeat on nearly every put."""
+    return json.dumps({"ttl": ttl, "tier": tier})
+
 
 class CacheLayer:
     """
@@ -36,16 +87,25 @@ class CacheLayer:
     """
     
     def __init__(self, db_path: str = None):
-        """Initialize cache with SQLite backend."""
+        """Initialize cache with SQLite backend (":memory:" for a throwaway cache)."""
         if db_path is None:
             db_path = os.path.expanduser("~/.openclaw/workspace/cache/responses.db")
         
         self.db_path = db_path
-        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         
         # Use check_same_thread=False for async operations
         self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
         self.conn.row_factory = sqlite3.Row
+        self._in_transaction = False
+        self._configure_connection()
+        
+        # Hit counters are buffered in memory and written in batches
+        self._pending_hits = Counter()   # entry id → hits not yet written
+        self._pending_hit_at = {}        # entry id → latest hit timestamp
+        self._hits_lock = threading.Lock()  # Guards both; get() may run on several threads
+        self._txn_hits = []              # Hits flushed inside the open transaction()
         
         self._init_schema()
         self._init_ttl_map()
@@ -58,9 +118,25 @@ class CacheLayer:
             "evictions": 0,
             "start_time": time.time(),
         }
+        self._started = time.monotonic()  # Uptime clock; immune to NTP/wall-clock jumps
         
         logger.info(f"CacheLayer initialized at {db_path}")
     
+    def _configure_connection(self):
+        """
+        Tune SQLite for a long-lived, write-often cache connection.
+        
+        WAL + synchronous=NORMAL drops the per-commit fsync (a crash can lose
+        the last few writes, which for a cache is just a future miss). The
+        page cache and mmap keep hot entries resident. Busy handling comes
+        from the connect() timeout.
+        """
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-64000")      # ~64 MB
+        self.conn.execute("PRAGMA mmap_size=268435456")    # 256 MB
+    
     def _init_schema(self):
         """Create tables if they don't exist."""
         schema_path = Path(__file__).parent / "schema.sql"
@@ -79,7 +155,7 @@ class CacheLayer:
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS cache_entries (
-                id INTEGER PRIMARY KEY,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 cache_key TEXT UNIQUE NOT NULL,
                 intent TEXT NOT NULL,
                 project TEXT,
@@ -90,13 +166,14 @@ class CacheLayer:
                 hit_count INTEGER DEFAULT 0,
                 tokens_saved INTEGER DEFAULT 0,
                 tier TEXT DEFAULT 'exact_match',
-                metadata TEXT
+                metadata TEXT,
+                last_hit_at INTEGER
             )
         """)
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS cache_metrics (
-                id INTEGER PRIMARY KEY,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp INTEGER NOT NULL,
                 event_type TEXT NOT NULL,
                 intent TEXT,
@@ -106,9 +183,23 @@ class CacheLayer:
             )
         """)
         
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_key ON cache_entries(cache_key)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invalidation_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                target_type TEXT,
+                target_value TEXT,
+                keys_cleared INTEGER
+            )
+        """)
+        
+        # cache_key is served by its UNIQUE index; these back the clear_* paths
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_intent ON cache_entries(intent)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_project ON cache_entries(project)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries(expires_at)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON cache_metrics(timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_invalidation_timestamp ON invalidation_log(timestamp)")
         
         self.conn.commit()
         logger.debug("Inline schema created")
@@ -143,10 +234,48 @@ class CacheLayer:
             "unknown": 3600,
         }
     
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into a single transaction (one commit, not N).
+        
+        Usage:
+            with cache.transaction():
+                cache.put("status_check", {...}, project="A")
+                cache.put("how_to", {...}, project="A")
+        
+        Rolls back if the block raises. Nested calls join the outer transaction.
+        Buffered hits are flushed before BEGIN; any flushed inside the block
+        go back into the buffer on rollback rather than being lost.
+        """
+        if self._in_transaction:
+            yield self
+            return
+        
+        self.flush_hits()
+        self.conn.commit()  # Close any implicit transaction before BEGIN
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield self
+        except Exception:
+            self.conn.rollback()
+            self._restore_hits(self._txn_hits)
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._in_transaction = False
+            self._txn_hits = []
+    
+    def _commit(self):
+        """Commit unless an enclosing transaction() will commit for us."""
+        if not self._in_transaction:
+            self.conn.commit()
+    
     def _make_cache_key(self, intent: str, project: str = None, state_sig: str = "") -> str:
         """Generate deterministic cache key from intent + project + state."""
-        key_data = f"{intent}:{project or 'global'}:{state_sig}"
-        return hashlib.sha256(key_data.encode()).hexdigest()[:12]
+        return hash_cache_key(intent, project, state_sig)
     
     def get(self, intent: str, project: str = None, state_sig: str = "") -> Optional[Dict[str, Any]]:
         """
@@ -175,14 +304,15 @@ class CacheLayer:
             row = cursor.fetchone()
             
             if row:
-                # Update hit count and last_hit_at
+                # Buffer hit count and last_hit_at (see flush_hits)
                 entry_id = row["id"]
-                cursor.execute("""
-                    UPDATE cache_entries 
-                    SET hit_count = hit_count + 1, last_hit_at = ?
-                    WHERE id = ?
-                """, (now, entry_id))
-                self.conn.commit()
+                with self._hits_lock:
+                    self._pending_hits[entry_id] += 1
+                    self._pending_hit_at[entry_id] = now
+                    hit_count = row["hit_count"] + self._pending_hits[entry_id]
+                    flush_due = self._pending_hits.total() >= HIT_FLUSH_THRESHOLD
+                if flush_due:
+                    self.flush_hits()
                 
                 # Update stats
                 self.stats["hits"] += 1
@@ -190,19 +320,19 @@ class CacheLayer:
                 self.stats["tokens_saved"] += tokens
                 
                 # Log metric
-                self._log_metric("cache_hit", intent, project, "exact_match", tokens)
+                self._log_metric("cache_hit", intent, project, "exact_match", tokens, now)
                 
                 return {
-                    "value": json.loads(row["response"]),
+                    "value": _loads(row["response"]),
                     "metadata": json.loads(row["metadata"] or "{}"),
-                    "hit_count": row["hit_count"],
+                    "hit_count": hit_count,
                     "age_seconds": now - row["created_at"],
                     "tokens_saved": tokens,
                 }
             
             # Miss
             self.stats["misses"] += 1
-            self._log_metric("cache_miss", intent, project, "exact_match", 0)
+            self._log_metric("cache_miss", intent, project, "exact_match", 0, now)
             return None
             
         except Exception as e:
@@ -237,6 +367,7 @@ class CacheLayer:
         expires_at = now + ttl
         
         try:
+            self.flush_hits()  # REPLACE deletes the old row; don't strand its buffered hits
             cursor = self.conn.cursor()
             cursor.execute("""
                 INSERT OR REPLACE INTO cache_entries 
@@ -247,19 +378,19 @@ class CacheLayer:
                 key,
                 intent,
                 project,
-                json.dumps(response),
+                _dumps(response),
                 state_sig,
                 now,
                 expires_at,
                 tokens_saved,
                 tier,
-                json.dumps({"ttl": ttl, "tier": tier}),
+                _encode_entry_metadata(ttl, tier),
             ))
-            self.conn.commit()
+            self._commit()
             
             self.stats["writes"] += 1
             self.stats["tokens_saved"] += tokens_saved
-            self._log_metric("cache_write", intent, project, tier, tokens_saved)
+            self._log_metric("cache_write", intent, project, tier, tokens_saved, now)
             
             logger.debug(f"Cached {intent} (key={key}, ttl={ttl}s, tokens_saved={tokens_saved})")
             return key
@@ -273,14 +404,16 @@ class CacheLayer:
         now = int(time.time())
         
         try:
+            self.flush_hits()  # Buffered hits are keyed by row id; settle them before deleting
             cursor = self.conn.cursor()
             cursor.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
             cleared = cursor.rowcount
-            self.conn.commit()
+            self._commit()
             
             if cleared > 0:
-                self._log_invalidation("ttl_expiry", None, None, cleared)
+                self._log_invalidation("ttl_expiry", None, None, cleared, now)
                 self.stats["evictions"] += cleared
+                self._optimize()
                 logger.info(f"Cleared {cleared} expired cache entries")
             
             return cleared
@@ -292,14 +425,16 @@ class CacheLayer:
     def clear_by_project(self, project: str, reason: str = "project_change") -> int:
         """Clear all cache entries for a project (e.g., after git commit)."""
         try:
+            self.flush_hits()
             cursor = self.conn.cursor()
             cursor.execute("DELETE FROM cache_entries WHERE project = ?", (project,))
             cleared = cursor.rowcount
-            self.conn.commit()
+            self._commit()
             
             if cleared > 0:
                 self._log_invalidation(reason, None, project, cleared)
                 self.stats["evictions"] += cleared
+                self._optimize()
                 logger.info(f"Cleared {cleared} cache entries for project {project} ({reason})")
             
             return cleared
@@ -311,14 +446,16 @@ class CacheLayer:
     def clear_by_intent(self, intent: str, reason: str = "intent_clear") -> int:
         """Clear all entries for an intent type."""
         try:
+            self.flush_hits()
             cursor = self.conn.cursor()
             cursor.execute("DELETE FROM cache_entries WHERE intent = ?", (intent,))
             cleared = cursor.rowcount
-            self.conn.commit()
+            self._commit()
             
             if cleared > 0:
                 self._log_invalidation(reason, intent, None, cleared)
                 self.stats["evictions"] += cleared
+                self._optimize()
                 logger.info(f"Cleared {cleared} cache entries for intent {intent} ({reason})")
             
             return cleared
@@ -326,23 +463,63 @@ class CacheLayer:
         except Exception as e:
             logger.error(f"Clear by intent error: {e}")
             return 0
+
+    def compact(self, max_age_seconds: int = 30 * 86400) -> int:
+        """
+        Trim metric and invalidation history older than max_age_seconds.
+
+        Both logs are append-only, so call this periodically (alongside
+        clear_expired) to keep them bounded.
+        """
+        cutoff = int(time.time()) - max_age_seconds
+
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM cache_metrics WHERE timestamp < ?", (cutoff,))
+            trimmed = cursor.rowcount
+            cursor.execute("DELETE FROM invalidation_log WHERE timestamp < ?", (cutoff,))
+            trimmed += cursor.rowcount
+            self._commit()
+
+            if trimmed > 0:
+                logger.info(f"Compacted {trimmed} log rows older than {max_age_seconds}s")
+
+            return trimmed
+
+        except Exception as e:
+            logger.error(f"Compact error: {e}")
+            return 0
+
+    def _optimize(self):
+        """Refresh planner stats after a bulk delete (a no-op unless they went stale)."""
+        try:
+            self.conn.execute("PRAGMA optimize")
+        except Exception as e:
+            logger.warning(f"Optimize error: {e}")
     
     def _log_metric(self, event_type: str, intent: str = None, project: str = None, 
-                    tier: str = None, tokens: int = 0):
-        """Log cache metric."""
+                    tier: str = None, tokens: int = 0, timestamp: int = None):
+        """Log cache metric. Callers that already read the clock pass it as timestamp."""
+        if timestamp is None:
+            timestamp = int(time.time())
+        
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
                 INSERT INTO cache_metrics 
                 (timestamp, event_type, intent, project, tier, tokens_saved)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (int(time.time()), event_type, intent, project, tier, tokens))
-            self.conn.commit()
+            """, (timestamp, event_type, intent, project, tier, tokens))
+            self._commit()
         except Exception as e:
             logger.warning(f"Metric log error: {e}")
     
-    def _log_invalidation(self, reason: str, intent: str = None, project: str = None, count: int = 0):
+    def _log_invalidation(self, reason: str, intent: str = None, project: str = None, count: int = 0,
+                          timestamp: int = None):
         """Log invalidation event."""
+        if timestamp is None:
+            timestamp = int(time.time())
+        
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
@@ -350,18 +527,59 @@ class CacheLayer:
                 (timestamp, reason, target_type, target_value, keys_cleared)
                 VALUES (?, ?, ?, ?, ?)
             """, (
-                int(time.time()),
+                timestamp,
                 reason,
                 "intent" if intent else "project" if project else "all",
                 intent or project or "all",
                 count
             ))
-            self.conn.commit()
+            self._commit()
         except Exception as e:
             logger.warning(f"Invalidation log error: {e}")
     
+    def flush_hits(self) -> int:
+        """
+        Write buffered hit counts back to cache_entries in one batch.
+        
+        Called automatically every HIT_FLUSH_THRESHOLD hits, before put() and
+        the clear_* deletes (so no buffered id outlives its row), from
+        get_stats() and from close(). Returns number of entries updated.
+        """
+        with self._hits_lock:
+            if not self._pending_hits:
+                return 0
+            updates = [
+                (count, self._pending_hit_at[entry_id], entry_id)
+                for entry_id, count in self._pending_hits.items()
+            ]
+            self._pending_hits.clear()
+            self._pending_hit_at.clear()
+        
+        try:
+            self.conn.executemany("""
+                UPDATE cache_entries 
+                SET hit_count = hit_count + ?, last_hit_at = ?
+                WHERE id = ?
+            """, updates)
+            if self._in_transaction:
+                self._txn_hits.extend(updates)  # Restored if the transaction rolls back
+            self._commit()
+            return len(updates)
+        except Exception as e:
+            logger.warning(f"Hit flush error: {e}")
+            return 0
+    
+    def _restore_hits(self, updates):
+        """Put flushed (count, last_hit_at, id) updates back into the buffer."""
+        with self._hits_lock:
+            for count, hit_at, entry_id in updates:
+                self._pending_hits[entry_id] += count
+                self._pending_hit_at[entry_id] = max(hit_at, self._pending_hit_at.get(entry_id, hit_at))
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
+        self.flush_hits()
+        
         total_requests = self.stats["hits"] + self.stats["misses"]
         hit_rate = (self.stats["hits"] / total_requests * 100) if total_requests > 0 else 0
         
@@ -375,7 +593,7 @@ class CacheLayer:
         except:
             cache_entries = expired_entries = 0
         
-        uptime = time.time() - self.stats["start_time"]
+        uptime = time.monotonic() - self._started
         
         return {
             "hits": self.stats["hits"],
@@ -407,7 +625,10 @@ class CacheLayer:
     def close(self):
         """Close database connection."""
         if self.conn:
+            self.flush_hits()
+            self._optimize()
             self.conn.close()
+            self.conn = None  # Makes a second close() a no-op
             logger.info("CacheLayer closed")
 
 
@@ -13,7 +13,6 @@ This script runs as a git post-commit hook and invalidates cache for the project
 
 import subprocess
 import sys
-import os
 import sqlite3
 import logging
 from pathlib import Path
@@ -84,33 +83,24 @@ def invalidate_project_cache(project_name: str):
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        # Get count before
-        cursor.execute("SELECT COUNT(*) FROM cache_entries WHERE project = ?", (project_name,))
-        count_before = cursor.fetchone()[0]
-        
-        # Delete entries for this project
+        # Delete entries for this project (rowcount = entries cleared)
         cursor.execute(
             "DELETE FROM cache_entries WHERE project = ?",
             (project_name,)
         )
-        
-        # Get count after
-        count_after = cursor.execute(
-            "SELECT COUNT(*) FROM cache_entries WHERE project = ?",
-            (project_name,)
-        ).fetchone()[0]
+        cleared = cursor.rowcount
         
         # Log invalidation
         cursor.execute(
             "INSERT INTO invalidation_log (timestamp, reason, target_type, target_value, keys_cleared) "
             "VALUES (strftime('%s', 'now'), ?, ?, ?, ?)",
-            ("git_commit", "project", project_name, count_before - count_after)
+            ("git_commit", "project", project_name, cleared)
         )
         
         conn.commit()
         conn.close()
         
-        logger.info(f"Cache invalidated: {count_before} → {count_after} entries for {project_name}")
+        logger.info(f"Cache invalidated: {cleared} entries cleared for {project_name}")
         return True
         
     except Exception as e:
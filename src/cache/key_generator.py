@@ -15,12 +15,25 @@ import json
 import logging
 import subprocess
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from pathlib import Path
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# ASCII unit separator: can't collide with ':' or '/' inside project names
+_KEY_SEP = b"\x1f"
+
+
+def hash_cache_key(intent: str, project: str = None, state_sig: str = "") -> str:
+    """
+    Hash intent + project + state signature into a 12-char cache key.
+    
+    Shared by CacheKeyGenerator and CacheLayer so both always agree on
+    the key stored in cache_entries.
+    """
+    key_data = _KEY_SEP.join((intent.encode(), (project or "global").encode(), state_sig.encode()))
+    return hashlib.blake2b(key_data, digest_size=6).hexdigest()
+
 
 class CacheKeyGenerator:
     """
@@ -40,6 +53,8 @@ class CacheKeyGenerator:
         
         self.projects_root = projects_root
         self.state_cache = {}  # In-memory cache of project states
+        self._sig_cache = {}   # project → (git stamp, state signature)
+        self._git_paths = {}   # project → [git dir, HEAD stat, ref path] (see _git_stamp)
     
     def generate_cache_key(self, intent: str, project: str = None, state_sig: str = None) -> str:
         """
@@ -54,7 +69,7 @@ class CacheKeyGenerator:
             Deterministic hex string (12 chars)
         
         Design:
-            key = SHA256(intent:project:state_sig)[:12]
+            key = hash_cache_key(intent, project, state_sig)
             - If state changes (new commit), key changes, cache miss occurs
             - If nothing changes, key is identical, cache hit
         """
@@ -63,8 +78,7 @@ class CacheKeyGenerator:
         else:
             state_sig = state_sig or "global"
         
-        key_data = f"{intent}:{project or 'global'}:{state_sig}"
-        key = hashlib.sha256(key_data.encode()).hexdigest()[:12]
+        key = hash_cache_key(intent, project, state_sig)
         
         logger.debug(f"Generated key: {key} (intent={intent}, project={project}, state={state_sig})")
         return key
@@ -185,16 +199,78 @@ class CacheKeyGenerator:
         This is what changes when project state changes.
         If signature is same, cache key is same (cache hit).
         If signature differs, cache key differs (cache miss).
+        
+        Kept fresh against the repo's git metadata (see _git_stamp): after a
+        commit or checkout the cached project state is dropped and re-read,
+        so the signature no longer goes stale until invalidate_project().
         """
+        stamp = self._git_stamp(project)
+        cached = self._sig_cache.get(project)
+        if cached is not None:
+            if stamp is not None and cached[0] == stamp:
+                return cached[1]
+            # Repo moved on (commit, checkout) since the state was read
+            self.state_cache.pop(project, None)
+        
         state = self.get_project_state(project)
         
         # Include: branch + commit + deploy status
         sig_data = f"{state['branch']}:{state['last_commit']}:{state['deploy_status']}"
-        sig = hashlib.sha256(sig_data.encode()).hexdigest()[:8]
+        sig = hashlib.blake2b(sig_data.encode(), digest_size=4).hexdigest()
+        
+        if stamp is not None:
+            self._sig_cache[project] = (stamp, sig)
         
         logger.debug(f"State signature for {project}: {sig}")
         return sig
     
+    def _git_stamp(self, project: str) -> Optional[Tuple]:
+        """
+        Cheap change detector for a project's git state.
+        
+        Returns (mtime_ns, size) for .git/HEAD, .git/index and the branch ref
+        HEAD points at. Commits rewrite the ref and index; checkouts rewrite
+        HEAD. The git dir and ref path are cached per project (HEAD is only
+        re-read when its own stat changes), so a call is a few os.stat().
+        Returns None when there is no plain .git directory (not a repo,
+        worktree, submodule), which disables the freshness check.
+        """
+        paths = self._git_paths.get(project)
+        if paths is None:
+            project_dir = self._find_project_dir(project)
+            if not project_dir:
+                return None
+            paths = self._git_paths[project] = [os.path.join(project_dir, ".git"), None, None]
+        
+        git_dir, head_seen, ref_path = paths
+        try:
+            head = os.path.join(git_dir, "HEAD")
+            st = os.stat(head)  # Missing HEAD (not a repo) → OSError → None
+            head_stat = (st.st_mtime_ns, st.st_size)
+            if head_stat != head_seen:
+                with open(head) as f:
+                    head_ref = f.read().strip()
+                ref_path = os.path.join(git_dir, head_ref[5:]) if head_ref.startswith("ref: ") else None
+                paths[1:] = head_stat, ref_path
+            
+            return (
+                head_stat,
+                self._stat_key(os.path.join(git_dir, "index")),
+                self._stat_key(ref_path) if ref_path else None,
+            )
+            
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _stat_key(path: str) -> Optional[Tuple[int, int]]:
+        """(mtime_ns, size) of path, or None if missing (e.g. packed ref, empty index)."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
     def _find_project_dir(self, project: str) -> Optional[Path]:
         """Find project directory by name or return as-is if full path."""
         if os.path.isdir(project):
@@ -294,6 +370,8 @@ class CacheKeyGenerator:
         Invalidate cached state for a project.
         Call this after git commit, deploy, etc.
         """
+        self._sig_cache.pop(project, None)
+        self._git_paths.pop(project, None)
         if project in self.state_cache:
             del self.state_cache[project]
             logger.info(f"Invalidated cached state for {project}")
@@ -20,7 +20,9 @@ CREATE TABLE IF NOT EXISTS cache_entries (
     last_hit_at INTEGER
 );
 
-CREATE INDEX IF NOT EXISTS idx_cache_key ON cache_entries(cache_key);
+-- cache_key lookups use the UNIQUE constraint's index; a second index on
+-- the same column only doubles write cost
+DROP INDEX IF EXISTS idx_cache_key;
 CREATE INDEX IF NOT EXISTS idx_cache_intent ON cache_entries(intent);
 CREATE INDEX IF NOT EXISTS idx_cache_project ON cache_entries(project);
 CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries(expires_at);
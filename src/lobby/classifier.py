@@ -9,16 +9,18 @@ Fast, cheap, accurate enough for routing decisions.
 Fallback to keyword-based classification if LLM fails.
 """
 
-import json
 import logging
 import requests
 import os
-from typing import Tuple, Optional
+from typing import Optional
 from dataclasses import dataclass
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# Longest message excerpt sent to the LLM; intent is evident well before this
+MAX_LLM_MESSAGE_CHARS = 2000
+
 
 class IntentType(Enum):
     """Valid intent classifications."""
@@ -58,7 +60,7 @@ class LobbyClassifier:
         if groq_api_key is None:
             groq_api_key = os.environ.get("GROQ_API_KEY")
         
-        self.api_key = groq_api_key
+        self.api_key = groq_api_key  # Also builds self._headers (see setter)
         self.model = model
         self.groq_url = "https://api.groq.com/openai/v1/chat/completions"
         
@@ -119,6 +121,16 @@ class LobbyClassifier:
             },
         }
     
+    @property
+    def api_key(self) -> Optional[str]:
+        """Groq API key; setting it rebuilds the cached request headers."""
+        return self._api_key
+    
+    @api_key.setter
+    def api_key(self, value: Optional[str]):
+        self._api_key = value
+        self._headers = {"Authorization": f"Bearer {value}"} if value else {}
+    
     def classify(self, message: str) -> Classification:
         """
         Classify a message into an intent type.
@@ -129,6 +141,18 @@ class LobbyClassifier:
         Returns:
             Classification with intent, confidence, method, cacheable, ttl
         """
+        # Phase 0: Nothing to classify, don't spend an API call on it
+        if not message or not message.strip():
+            config = self.intents[IntentType.TRIVIAL]
+            return Classification(
+                intent=IntentType.TRIVIAL.value,
+                confidence=0.5,
+                method="fallback",
+                cacheable=config["cacheable"],
+                ttl=config["ttl"],
+                reason="Empty message",
+            )
+        
         # Phase 1: Fast keyword matching
         keyword_result = self._classify_by_keywords(message)
         if keyword_result:
@@ -181,14 +205,14 @@ Categories and examples:
 - trivial: "Thanks!" "Got it" "Cool" "Nice job"
 - unknown: Doesn't fit above
 
-Message: "{message}"
+Message: "{message[:MAX_LLM_MESSAGE_CHARS]}"
 
 Respond with ONLY the category name in lowercase (status_check, how_to, etc), no explanation."""
 
         try:
             response = requests.post(
                 self.groq_url,
-                headers={"Authorization": f"Bearer {self.api_key}"},
+                headers=self._headers,
                 json={
                     "model": self.model,
                     "messages": [{"role": "user", "content": prompt}],
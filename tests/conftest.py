@@ -0,0 +1,11 @@
+"""
+Shared pytest configuration for Marvin tests.
+Puts src/ on sys.path once, instead of in every test module.
+"""
+
+import sys
+from pathlib import Path
+
+SRC = str(Path(__file__).parent.parent / "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)